@@ -7,6 +7,35 @@ import re
 import shutil
 from textwrap import dedent
 
+# Optional faster codecs, the stdlib is used when they aren't installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+if yaml is not None:
+    # The C loader is much faster but only exists when PyYAML was built against libyaml
+    class SpecLoader(getattr(yaml, 'CSafeLoader', yaml.SafeLoader)):
+        # Keeps mapping keys as they are spelled in the spec, otherwise 200 becomes an int, on becomes True and null None
+        def construct_mapping(self, node, deep=False):
+            self.flatten_mapping(node)
+            mapping = {}
+            for key_node, value_node in node.value:
+                if isinstance(key_node, yaml.ScalarNode):
+                    key = key_node.value
+                else:
+                    key = self.construct_object(key_node, deep=deep)
+                mapping[key] = self.construct_object(value_node, deep=deep)
+            return mapping
+
+    # Dates and times stay strings as spelled, the same as the JSON form of the spec
+    SpecLoader.add_constructor('tag:yaml.org,2002:timestamp', lambda loader, node: node.value)
+
 tokenizer = tiktoken.encoding_for_model("text-embedding-ada-002")
 
 output_directory = 'minified_openapi_docs'
@@ -50,6 +79,17 @@ keys_to_keep = {
 
 methods_to_handle = {"get", "post", "patch", "delete"}
 
+# Writes the $ref dependency graph of components and operations next to the output directory
+dependency_graph = True
+dependency_graph_filepath = f'{output_directory}_dependency_graph.json'
+
+# Split the work across machines by tag. Each shard writes a partial output to {output_directory}_shard_{shard_index}
+# Once every partial output is copied to one machine, run again with merge_shards = True and the same shard_count
+shard_count = 1
+shard_index = 0
+merge_shards = False
+shard_manifest_filename = 'shard_manifest.json'
+
 # Saves tokens be abbreviating in a way understood by the LLM
 # Must be lowercase
 key_abbreviations = {
@@ -69,10 +109,16 @@ key_abbreviations = {
 }
 
 def main():
-    
-    # Load JSON file into a Python dictionary
-    with open(input_filepath) as f:
-        openapi_spec = json.load(f)
+
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f'shard_index must be between 0 and {shard_count - 1}, got {shard_index}')
+
+    if merge_shards:
+        merge_shard_outputs()
+        return
+
+    # Load JSON or YAML file into a Python dictionary
+    openapi_spec = load_spec(input_filepath)
 
     # Create list of processed and parsed individual endpoints
     endpoints_by_tag, endpoints_by_tag_metadata, server_url, tag_summary_dict = write_endpoints(openapi_spec)
@@ -86,10 +132,19 @@ def main():
     #     create_key_point_guide_for_chunks(docs, tag_summary_dict)
     #     count_tokens_in_directory(f'{output_directory}/balanced_chunks')
     # else:
+    if shard_count > 1:
+        # Partial output, merge_shard_outputs writes the keypoint guide for the whole spec
+        shard_directory = shard_output_directory(shard_index)
+        create_endpoint_files(endpoints_by_tag_metadata, shard_directory)
+        write_shard_manifest(shard_directory, tag_summary_dict)
+        count_tokens_in_directory(shard_directory)
+        return
     # default case
     endpoints_by_tag_metadata = create_endpoint_files(endpoints_by_tag_metadata)
     create_key_point_guide(endpoints_by_tag_metadata, tag_summary_dict)
     count_tokens_in_directory(f'{output_directory}')
+    if dependency_graph:
+        write_dependency_graph(build_dependency_graph(openapi_spec))
     # Create LLM OAS keypoint generator guide file 
     # Need to add summaries 
     
@@ -110,67 +165,64 @@ def write_endpoints(openapi_spec):
             if name and description:
                 tag_summary_dict[name] = description.lower()
 
+    # Tag and doc numbers are fixed before processing so every shard agrees on them
+    numbering = assign_numbers(openapi_spec)
+
     # Dictionary with each unique tag as a key, and the value is a list of finalized endpoints with that tag
     endpoints_by_tag = defaultdict(list)
     endpoints_by_tag_metadata = defaultdict(list)
     endpoint_counter = 0
-    for path, methods in openapi_spec['paths'].items():
-        for method, endpoint in methods.items():
-            if method not in methods_to_handle:
-                continue
-            if endpoint.get('deprecated', False) and not keys_to_keep["deprecated"]:
-                continue
-            endpoint_counter += 1
-            
-            # Adds schema to each endpoint
-            if keys_to_keep["schemas"]:
-                extracted_endpoint_data = resolve_refs(openapi_spec, endpoint)
-            else:
-                extracted_endpoint_data = endpoint
-            
-            # Populate output list with desired keys
-            extracted_endpoint_data = populate_keys(extracted_endpoint_data, path)
-
-            # If key == None or key == ''
-            extracted_endpoint_data = remove_empty_keys(extracted_endpoint_data)
-
-            # Remove unwanted keys
-            extracted_endpoint_data = remove_unnecessary_keys(extracted_endpoint_data)
-
-            # Flattens to remove nested objects where the dict has only one key
-            extracted_endpoint_data = flatten_endpoint(extracted_endpoint_data)
+    for path, method, endpoint, tag in iter_operations(openapi_spec):
+        tag_number, doc_number = numbering[(path, method)]
+        # In shard mode only the tags assigned to this shard are processed
+        if tag_number % shard_count != shard_index:
+            continue
+        endpoint_counter += 1
+        
+        # Adds schema to each endpoint
+        if keys_to_keep["schemas"]:
+            extracted_endpoint_data = resolve_refs(openapi_spec, endpoint)
+        else:
+            extracted_endpoint_data = endpoint
+        
+        # Populate output list with desired keys
+        extracted_endpoint_data = populate_keys(extracted_endpoint_data, path)
 
-            # Replace common keys with abbreviations and sets all text to lower case
-            extracted_endpoint_data = minify(extracted_endpoint_data, key_abbreviations)
-            
-            # Get the tags of the current endpoint
-            tags = endpoint.get('tags', [])
-            tags = [tag for tag in tags]
-            if not tags:
-                tag = 'default'
-            # For each tag, add the finalized endpoint to the corresponding list in the dictionary
-            for tag in tags:
-                endpoints_by_tag[tag].append(extracted_endpoint_data)
+        # If key == None or key == ''
+        extracted_endpoint_data = remove_empty_keys(extracted_endpoint_data)
 
-            operation_id = endpoint.get('operationId', '').lower()
+        # Remove unwanted keys
+        extracted_endpoint_data = remove_unnecessary_keys(extracted_endpoint_data)
 
-            api_url = api_url_format.format(tag=tag, operationId=operation_id)
+        # Flattens to remove nested objects where the dict has only one key
+        extracted_endpoint_data = flatten_endpoint(extracted_endpoint_data)
 
-            context_string = write_dict_to_text(extracted_endpoint_data)
-            metadata = {
-                'tag': tag,
-                'tag_number': 0,
-                'doc_number': 0,
-                'operation_id': operation_id,
-                'doc_url': api_url,
-                'server_url': f'{server_url}{path}'
-            }
-            endpoint_dict = {
-                "metadata": metadata,
-                "context": context_string
-            }
+        # Replace common keys with abbreviations and sets all text to lower case
+        extracted_endpoint_data = minify(extracted_endpoint_data, key_abbreviations)
+        
+        # For each tag, add the finalized endpoint to the corresponding list in the dictionary
+        for endpoint_tag in endpoint.get('tags', []):
+            endpoints_by_tag[endpoint_tag].append(extracted_endpoint_data)
+
+        operation_id = endpoint.get('operationId', '').lower()
+
+        api_url = api_url_format.format(tag=tag, operationId=operation_id)
+
+        context_string = write_dict_to_text(extracted_endpoint_data)
+        metadata = {
+            'tag': tag,
+            'tag_number': tag_number,
+            'doc_number': doc_number,
+            'operation_id': operation_id,
+            'doc_url': api_url,
+            'server_url': f'{server_url}{path}'
+        }
+        endpoint_dict = {
+            "metadata": metadata,
+            "context": context_string
+        }
 
-            endpoints_by_tag_metadata[tag].append(endpoint_dict)
+        endpoints_by_tag_metadata[tag].append(endpoint_dict)
 
     # Sort alphabetically by tag name
     sorted_items = sorted(endpoints_by_tag.items())
@@ -187,7 +239,32 @@ def write_endpoints(openapi_spec):
 
     print(f'{endpoint_counter} endpoints found')
     return endpoints_by_tag, endpoints_by_tag_metadata, server_url, tag_summary_dict
-            
+
+def iter_operations(openapi_spec):
+    # Every operation that gets a doc, along with the tag the doc is filed under
+    for path, methods in openapi_spec['paths'].items():
+        for method, endpoint in methods.items():
+            if method not in methods_to_handle:
+                continue
+            if endpoint.get('deprecated', False) and not keys_to_keep["deprecated"]:
+                continue
+            # The docs are filed under the last tag of the endpoint
+            tags = endpoint.get('tags', [])
+            tag = tags[-1] if tags else 'default'
+            yield path, method, endpoint, tag
+
+def assign_numbers(openapi_spec):
+    # Numbers tags alphabetically and docs in spec order within their tag, same as a single pass over the spec
+    operations_by_tag = defaultdict(list)
+    for path, method, endpoint, tag in iter_operations(openapi_spec):
+        operations_by_tag[tag].append((path, method))
+
+    numbering = {}
+    for tag_number, tag in enumerate(sorted(operations_by_tag)):
+        for doc_number, operation in enumerate(operations_by_tag[tag]):
+            numbering[operation] = (tag_number, doc_number)
+    return numbering
+
 def resolve_refs(openapi_spec, endpoint):
     if isinstance(endpoint, dict):
         new_endpoint = {}
@@ -350,42 +427,89 @@ def minify(data, abbreviations):
         # Return data unchanged if it's not a dict, list or string
         return data
 
-def create_endpoint_files(endpoints_by_tag_metadata):
+def create_endpoint_files(endpoints_by_tag_metadata, directory=None):
+    directory = directory or output_directory
 
-    # If output_directory exists, delete it.
-    root_output_directory = os.path.join(output_directory)
+    # If the directory exists, delete it.
+    root_output_directory = os.path.join(directory)
     if os.path.exists(root_output_directory):
         shutil.rmtree(root_output_directory)
 
-    # Initialize tag and operationId counters
-    tag_counter = 0
-    
-
     # Now, iterate over each unique tag
     for tag, endpoints_with_tag in endpoints_by_tag_metadata.items():
-        endpoint_counter = 0
         # Create a subdirectory for the tag
-        tag_directory = os.path.join(output_directory, tag)
+        tag_directory = os.path.join(directory, tag)
         os.makedirs(tag_directory, exist_ok=True)
 
         for endpoint in endpoints_with_tag:
-            endpoint['metadata']['tag_number'] = tag_counter
-            endpoint['metadata']['doc_number'] = endpoint_counter
-   
+            # Tag and doc numbers are assigned up front by assign_numbers
+            metadata = endpoint['metadata']
+
             # Create a file name 
-            file_name = f"{tag_counter}-{endpoint_counter}.json"
+            file_name = f"{metadata['tag_number']}-{metadata['doc_number']}.json"
             # Define the file path
             file_path = os.path.join(tag_directory, file_name)
 
             # Write the data to a JSON file
-            with open(file_path, 'w') as file:
-                json.dump(endpoint, file)
+            write_json(endpoint, file_path)
 
-            endpoint_counter += 1
+    return endpoints_by_tag_metadata
 
-        tag_counter += 1
+def shard_output_directory(index):
+    return f'{output_directory}_shard_{index}'
 
-    return endpoints_by_tag_metadata
+def write_shard_manifest(directory, tag_summary_dict):
+    # Tag descriptions come from the spec, the merge step needs them for the keypoint guide
+    os.makedirs(directory, exist_ok=True)
+    manifest = {'shard_index': shard_index, 'shard_count': shard_count, 'tag_summary_dict': tag_summary_dict}
+    write_json(manifest, os.path.join(directory, shard_manifest_filename))
+
+def merge_shard_outputs():
+    # Check every shard ran with the same shard_count before touching the output
+    tag_summary_dict = {}
+    for index in range(shard_count):
+        manifest_path = os.path.join(shard_output_directory(index), shard_manifest_filename)
+        if not os.path.exists(manifest_path):
+            raise FileNotFoundError(f'missing output for shard {index}: {manifest_path}')
+        manifest = read_json(manifest_path)
+        if manifest['shard_count'] != shard_count or manifest['shard_index'] != index:
+            raise ValueError(
+                f'{manifest_path} is shard {manifest["shard_index"]} of {manifest["shard_count"]}, '
+                f'expected shard {index} of {shard_count}'
+            )
+        tag_summary_dict.update(manifest['tag_summary_dict'])
+
+    # If output_directory exists, delete it.
+    root_output_directory = os.path.join(output_directory)
+    if os.path.exists(root_output_directory):
+        shutil.rmtree(root_output_directory)
+
+    endpoints = []
+    for index in range(shard_count):
+        shard_directory = shard_output_directory(index)
+        # Tag directories are disjoint between shards so they can be copied as is
+        for tag in os.listdir(shard_directory):
+            tag_directory = os.path.join(shard_directory, tag)
+            if os.path.isdir(tag_directory):
+                shutil.copytree(tag_directory, os.path.join(output_directory, tag), dirs_exist_ok=True)
+        # Tags containing '/' are nested a level deeper, so walk the whole shard
+        for dirpath, dirnames, filenames in os.walk(shard_directory):
+            for filename in filenames:
+                if filename.endswith('.json') and filename != shard_manifest_filename:
+                    endpoints.append(read_json(os.path.join(dirpath, filename)))
+
+    # Rebuild the tag grouping in the same order as a single node run
+    endpoints.sort(key=lambda endpoint: (endpoint['metadata']['tag_number'], endpoint['metadata']['doc_number']))
+    endpoints_by_tag_metadata = defaultdict(list)
+    for endpoint in endpoints:
+        endpoints_by_tag_metadata[endpoint['metadata']['tag']].append(endpoint)
+
+    print(f'{len(endpoints)} endpoints merged from {shard_count} shards')
+    create_key_point_guide(endpoints_by_tag_metadata, tag_summary_dict)
+    count_tokens_in_directory(f'{output_directory}')
+    if dependency_graph:
+        openapi_spec = load_spec(input_filepath)
+        write_dependency_graph(build_dependency_graph(openapi_spec))
 
 # If balanced_chunks is True
 def create_balanced_chunks(endpoints_by_tag, server_url):
@@ -444,8 +568,7 @@ def create_balanced_chunks(endpoints_by_tag, server_url):
             file_path = os.path.join(endpoints_directory, file_name)
 
             # Write the data to a JSON file
-            with open(file_path, 'w') as file:
-                json.dump(json_output, file)
+            write_json(json_output, file_path)
 
             docs.append(doc)
             docid_counter += 1
@@ -676,16 +799,15 @@ def count_tokens_in_directory(directory):
     
     for dirpath, dirnames, filenames in os.walk(directory):
         for filename in filenames:
-            if filename.endswith('.json'):
+            if filename.endswith('.json') and filename != shard_manifest_filename:
                 filepath = os.path.join(dirpath, filename)
-                with open(filepath, 'r') as file:
-                    file_content = json.load(file)
-                    context_content = file_content.get("context", "")
-                    token_count = tiktoken_len(context_content)
-                    token_counts.append(token_count)
-                    if token_count > max_tokens:
-                        max_tokens = token_count
-                        max_file = filepath
+                file_content = read_json(filepath)
+                context_content = file_content.get("context", "")
+                token_count = tiktoken_len(context_content)
+                token_counts.append(token_count)
+                if token_count > max_tokens:
+                    max_tokens = token_count
+                    max_file = filepath
 
     print("Total files:", len(token_counts))
     if not token_counts:
@@ -697,6 +819,161 @@ def count_tokens_in_directory(directory):
 
     return token_counts
 
+def build_dependency_graph(openapi_spec):
+    # Nodes are component refs like '#/components/schemas/Transaction' and operations like 'get /v3/ledger/account'
+    # Each node is walked once for its direct refs, so building is linear in the spec size
+    node_index = {}
+    nodes = []
+    forward = []
+    operation_ids = {}
+
+    def get_node(name):
+        if name not in node_index:
+            node_index[name] = len(nodes)
+            nodes.append(name)
+            forward.append(set())
+        return node_index[name]
+
+    def collect_refs(data):
+        refs = set()
+        stack = [data]
+        while stack:
+            current_data = stack.pop()
+            if isinstance(current_data, dict):
+                for key, value in current_data.items():
+                    if key == '$ref' and isinstance(value, str):
+                        # Refs into the middle of a component count as a ref to the component itself
+                        if value.startswith('#/components/'):
+                            value = '/'.join(value.split('/')[:4])
+                        refs.add(value)
+                    elif isinstance(value, (dict, list)):
+                        stack.append(value)
+            elif isinstance(current_data, list):
+                stack.extend(item for item in current_data if isinstance(item, (dict, list)))
+        # Sorted so node numbering is the same on every run
+        return sorted(refs)
+
+    for section, components in openapi_spec.get('components', {}).items():
+        if not isinstance(components, dict):
+            continue
+        for name, component in components.items():
+            node = get_node(f'#/components/{section}/{name}')
+            for ref in collect_refs(component):
+                forward[node].add(get_node(ref))
+
+    # Same operations as write_endpoints so queries line up with the generated docs
+    for path, method, endpoint, tag in iter_operations(openapi_spec):
+        node = get_node(f'{method} {path}')
+        operation_ids[str(node)] = endpoint.get('operationId', '').lower()
+        for ref in collect_refs(endpoint):
+            forward[node].add(get_node(ref))
+
+    reverse = [[] for _ in nodes]
+    for node, targets in enumerate(forward):
+        for target in targets:
+            reverse[target].append(node)
+
+    return {
+        'nodes': nodes,
+        'operation_ids': operation_ids,
+        'forward': [sorted(targets) for targets in forward],
+        'reverse': [sorted(sources) for sources in reverse],
+        'node_index': node_index
+    }
+
+def write_dependency_graph(graph, filepath=None):
+    filepath = filepath or dependency_graph_filepath
+    edge_count = sum(len(targets) for targets in graph['forward'])
+    print(f'dependency graph: {len(graph["nodes"])} nodes, {edge_count} edges')
+    # node_index is rebuilt from nodes on load, so it's left out of the file
+    graph = {key: value for key, value in graph.items() if key != 'node_index'}
+    write_json(graph, filepath, separators=(',', ':'))
+
+def load_dependency_graph(filepath=None):
+    graph = read_json(filepath or dependency_graph_filepath)
+    graph['node_index'] = {node: index for index, node in enumerate(graph['nodes'])}
+    return graph
+
+def find_dependents(graph, name):
+    # Accepts a schema name like 'Transaction' or a full ref like '#/components/responses/Error'
+    ref = name if name.startswith('#/') else f'#/components/schemas/{name}'
+    start = graph['node_index'].get(ref)
+    if start is None:
+        return set()
+
+    # Walk the reverse edges, the visited set stops recursive schemas from looping
+    dependents = set()
+    stack = [start]
+    while stack:
+        node = stack.pop()
+        for source in graph['reverse'][node]:
+            if source not in dependents:
+                dependents.add(source)
+                stack.append(source)
+    dependents.discard(start)
+    return dependents
+
+def affected_operations(graph, name):
+    # Operations whose docs change if the component changes
+    operation_ids = graph['operation_ids']
+    return sorted(
+        operation_ids[str(node)] or graph['nodes'][node]
+        for node in find_dependents(graph, name)
+        if str(node) in operation_ids
+    )
+
+def schema_fan_in(graph, name):
+    # Number of components and operations that reference the component, directly or transitively
+    return len(find_dependents(graph, name))
+
+def load_spec(filepath):
+    if filepath.endswith(('.yaml', '.yml')):
+        if yaml is None:
+            raise ImportError('PyYAML is required to load YAML specs: pip install pyyaml')
+        with open(filepath, 'rb') as file:
+            return yaml.load(file, Loader=SpecLoader)
+    return read_json(filepath)
+
+# Every digit becomes 0 so long digit runs can be found with bytes.find, a regex over the whole spec is slower than orjson
+zero_digits = bytes.maketrans(b'123456789', b'000000000')
+digit_run_pattern = re.compile(rb'\d+')
+value_end_pattern = re.compile(rb'\s*[,\]}]')
+
+def has_wide_integers(content):
+    # Numbers under 19 digits always fit in the 64 bit range orjson keeps as int
+    zeroed = content.translate(zero_digits)
+    start = zeroed.find(b'0' * 19)
+    while start != -1:
+        end = digit_run_pattern.match(content, start).end()
+        number_start = start - 1 if content[start - 1:start] == b'-' else start
+        before = number_start
+        while content[before - 1:before] in (b' ', b'\t', b'\r', b'\n'):
+            before -= 1
+        # Only integer values count, digit runs inside strings like hex examples don't
+        is_integer_value = content[before - 1:before] in (b':', b'[', b',') and value_end_pattern.match(content, end)
+        if is_integer_value and not -2**63 <= int(content[number_start:end]) < 2**64:
+            return True
+        start = zeroed.find(b'0' * 19, end)
+    return False
+
+def read_json(filepath):
+    with open(filepath, 'rb') as file:
+        content = file.read()
+    # orjson reads integers wider than 64 bits as floats, specs with one go to the stdlib instead
+    if orjson is not None and not has_wide_integers(content):
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            # orjson rejects some input the stdlib accepts, like NaN and Infinity
+            pass
+    return json.loads(content)
+
+def write_json(data, filepath, **kwargs):
+    # orjson isn't used for writing since its output differs from the stdlib's (no spaces, no ascii escaping)
+    # json.dumps encodes in one call with the C encoder where json.dump writes chunk by chunk
+    with open(filepath, 'w') as file:
+        file.write(json.dumps(data, **kwargs))
+
 def tiktoken_len(text):
     tokens = tokenizer.encode(
         text,
@@ -704,6 +981,5 @@ def tiktoken_len(text):
     )
     return len(tokens)
 
-main()
-
-    
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import minifier
+
+wide_integer_spec = '''{
+    "openapi": "3.0.0",
+    "servers": [{"url": "https://api.example.com"}],
+    "paths": {
+        "/balance": {
+            "get": {
+                "operationId": "getBalance",
+                "tags": ["Account"],
+                "parameters": [
+                    {"name": "amount", "in": "query", "schema": {"type": "integer", "maximum": 123456789012345678901234}}
+                ]
+            }
+        }
+    }
+}'''
+
+
+def test_read_json_keeps_wide_integers(tmp_path):
+    spec_path = tmp_path / 'spec.json'
+    spec_path.write_text(wide_integer_spec)
+
+    openapi_spec = minifier.read_json(str(spec_path))
+
+    assert openapi_spec == json.loads(wide_integer_spec)
+    maximum = openapi_spec['paths']['/balance']['get']['parameters'][0]['schema']['maximum']
+    assert maximum == 123456789012345678901234
+    assert isinstance(maximum, int)
+
+
+def test_read_json_uses_orjson_for_long_digit_strings_and_64_bit_integers(tmp_path, monkeypatch):
+    orjson = pytest.importorskip('orjson')
+    content = (
+        '{"example": "0x00000000000000000000000000000000", "id": "1234567890123456789012",'
+        ' "maximum": 10762710243615955000, "minimum": -9223372036854775808, "values": [18446744073709551615]}'
+    )
+    spec_path = tmp_path / 'spec.json'
+    spec_path.write_text(content)
+
+    orjson_calls = []
+    orjson_loads = orjson.loads
+    monkeypatch.setattr(orjson, 'loads', lambda data: orjson_calls.append(data) or orjson_loads(data))
+
+    assert minifier.read_json(str(spec_path)) == json.loads(content)
+    assert len(orjson_calls) == 1
+
+
+def test_wide_integer_doc_text_matches_stdlib(tmp_path):
+    spec_path = tmp_path / 'spec.json'
+    spec_path.write_text(wide_integer_spec)
+
+    _, fast_docs, _, _ = minifier.write_endpoints(minifier.read_json(str(spec_path)))
+    _, stdlib_docs, _, _ = minifier.write_endpoints(json.loads(wide_integer_spec))
+
+    assert fast_docs == stdlib_docs
+    assert 'maximum 123456789012345678901234' in fast_docs['Account'][0]['context']
+
+
+def test_load_spec_keeps_yaml_keys_as_written(tmp_path):
+    pytest.importorskip('yaml')
+    spec_path = tmp_path / 'spec.yaml'
+    spec_path.write_text(
+        'properties:\n'
+        '  on: {type: boolean}\n'
+        '  No: {type: boolean}\n'
+        '  null: {type: string}\n'
+        '  ~: {type: string}\n'
+        'responses:\n'
+        '  200: {description: ok}\n'
+        'released: 2020-01-01\n'
+        'updated: 2020-01-01 10:00:00\n'
+        'created: 2020-01-01T10:00:00Z\n'
+    )
+
+    openapi_spec = minifier.load_spec(str(spec_path))
+
+    assert list(openapi_spec['properties']) == ['on', 'No', 'null', '~']
+    assert list(openapi_spec['responses']) == ['200']
+    assert openapi_spec['released'] == '2020-01-01'
+    assert openapi_spec['updated'] == '2020-01-01 10:00:00'
+    assert openapi_spec['created'] == '2020-01-01T10:00:00Z'
+
+
+def read_tree(directory):
+    tree = {}
+    for dirpath, dirnames, filenames in os.walk(directory):
+        for filename in filenames:
+            filepath = os.path.join(dirpath, filename)
+            with open(filepath, 'rb') as file:
+                tree[os.path.relpath(filepath, directory)] = file.read()
+    return tree
+
+
+@pytest.fixture
+def sharded_spec(tmp_path, monkeypatch):
+    # Bundled spec with a tag containing '/', which is written to a nested folder
+    openapi_spec = minifier.read_json(os.path.join(os.path.dirname(minifier.__file__), 'stackpath_edge_compute_swagger.json'))
+    for methods in openapi_spec['paths'].values():
+        for endpoint in methods.values():
+            if endpoint.get('tags') == ['Infrastructure']:
+                endpoint['tags'] = ['Alerts/Sub']
+    spec_path = tmp_path / 'spec.json'
+    spec_path.write_text(json.dumps(openapi_spec))
+    monkeypatch.setattr(minifier, 'input_filepath', str(spec_path))
+    monkeypatch.setattr(minifier, 'merge_shards', False)
+    return tmp_path
+
+
+def run_minifier(monkeypatch, output_directory, shard_count=1, shard_index=0, merge_shards=False):
+    monkeypatch.setattr(minifier, 'output_directory', str(output_directory))
+    monkeypatch.setattr(minifier, 'dependency_graph_filepath', f'{output_directory}_dependency_graph.json')
+    monkeypatch.setattr(minifier, 'shard_count', shard_count)
+    monkeypatch.setattr(minifier, 'shard_index', shard_index)
+    monkeypatch.setattr(minifier, 'merge_shards', merge_shards)
+    minifier.main()
+
+
+@pytest.mark.parametrize('shard_count', [2, 8])
+def test_sharded_run_and_merge_matches_single_run(sharded_spec, monkeypatch, shard_count):
+    single_directory = sharded_spec / 'single'
+    run_minifier(monkeypatch, single_directory)
+
+    merged_directory = sharded_spec / 'merged'
+    for index in range(shard_count):
+        run_minifier(monkeypatch, merged_directory, shard_count, index)
+    run_minifier(monkeypatch, merged_directory, shard_count, merge_shards=True)
+
+    single_tree = read_tree(single_directory)
+    assert 'Alerts/Sub/0-0.json' in single_tree
+    assert 'LLM_OAS_keypoint_guide_file.txt' in single_tree
+    assert read_tree(merged_directory) == single_tree
+    with open(f'{single_directory}_dependency_graph.json', 'rb') as single_graph:
+        with open(f'{merged_directory}_dependency_graph.json', 'rb') as merged_graph:
+            assert merged_graph.read() == single_graph.read()
+
+
+def test_merge_rejects_manifest_from_other_shard_count(sharded_spec, monkeypatch):
+    output_directory = sharded_spec / 'out'
+    for index in range(2):
+        run_minifier(monkeypatch, output_directory, 2, index)
+
+    with pytest.raises(ValueError, match='is shard 0 of 2, expected shard 0 of 1'):
+        run_minifier(monkeypatch, output_directory, 1, merge_shards=True)
+
+
+def test_merge_rejects_manifest_with_wrong_shard_index(sharded_spec, monkeypatch):
+    output_directory = sharded_spec / 'out'
+    for index in range(2):
+        run_minifier(monkeypatch, output_directory, 2, index)
+    os.rename(f'{output_directory}_shard_0', f'{output_directory}_shard_tmp')
+    os.rename(f'{output_directory}_shard_1', f'{output_directory}_shard_0')
+    os.rename(f'{output_directory}_shard_tmp', f'{output_directory}_shard_1')
+
+    with pytest.raises(ValueError, match='is shard 1 of 2, expected shard 0 of 2'):
+        run_minifier(monkeypatch, output_directory, 2, merge_shards=True)
+
+
+def test_shard_index_out_of_range(sharded_spec, monkeypatch):
+    with pytest.raises(ValueError, match='shard_index must be between 0 and 1, got 2'):
+        run_minifier(monkeypatch, sharded_spec / 'out', 2, 2)
+
+
+graph_spec = {
+    'paths': {
+        '/nodes': {'get': {'operationId': 'getNodes', 'responses': {'200': {'schema': {'$ref': '#/components/schemas/Node'}}}}},
+        '/pairs': {'get': {'operationId': 'getPairs', 'responses': {'200': {'schema': {'$ref': '#/components/schemas/A'}}}}},
+        '/wallets': {'post': {'operationId': 'createWallet', 'requestBody': {'$ref': '#/components/schemas/Wallet'}}},
+        '/balances': {'get': {'operationId': 'getBalance', 'parameters': [{'$ref': '#/components/schemas/Amount/properties/value'}]}},
+    },
+    'components': {
+        'schemas': {
+            'Node': {'properties': {'child': {'$ref': '#/components/schemas/Node'}}},
+            'A': {'properties': {'b': {'$ref': '#/components/schemas/B'}}},
+            'B': {'properties': {'a': {'$ref': '#/components/schemas/A'}}},
+            'Wallet': {'properties': {'account': {'$ref': '#/components/schemas/Account'}}},
+            'Account': {'properties': {'balance': {'$ref': '#/components/schemas/Amount'}}},
+            'Amount': {'properties': {'value': {'type': 'string'}}},
+        }
+    }
+}
+
+
+def test_dependency_graph_self_recursive_schema():
+    graph = minifier.build_dependency_graph(graph_spec)
+
+    assert minifier.affected_operations(graph, 'Node') == ['getnodes']
+    assert minifier.schema_fan_in(graph, 'Node') == 1
+
+
+def test_dependency_graph_cycle():
+    graph = minifier.build_dependency_graph(graph_spec)
+
+    assert minifier.affected_operations(graph, 'B') == ['getpairs']
+    # B and the operation depend on A, A itself isn't counted
+    assert minifier.schema_fan_in(graph, 'A') == 2
+    assert minifier.schema_fan_in(graph, 'B') == 2
+
+
+def test_dependency_graph_ref_into_component():
+    graph = minifier.build_dependency_graph(graph_spec)
+
+    assert '#/components/schemas/Amount/properties/value' not in graph['nodes']
+    assert 'getbalance' in minifier.affected_operations(graph, 'Amount')
+
+
+def test_dependency_graph_follows_refs_across_components(tmp_path):
+    filepath = str(tmp_path / 'graph.json')
+    minifier.write_dependency_graph(minifier.build_dependency_graph(graph_spec), filepath)
+    graph = minifier.load_dependency_graph(filepath)
+
+    assert minifier.affected_operations(graph, 'Amount') == ['createwallet', 'getbalance']
+    assert minifier.affected_operations(graph, '#/components/schemas/Account') == ['createwallet']
+    assert minifier.schema_fan_in(graph, 'Amount') == 4
+    assert minifier.affected_operations(graph, 'Missing') == []